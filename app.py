@@ -1,14 +1,37 @@
 import io
 import json
-from typing import Any
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Any, Callable
 
-import folium
-import osmnx as ox
 import pandas as pd
 import requests
 import streamlit as st
-from fpdf import FPDF
-from streamlit_folium import folium_static
+import streamlit.components.v1 as components
+
+from workers import (
+    LAYER_SCHEMA_VERSION,
+    assemble_scan,
+    cache_key,
+    cache_path,
+    fetch_features,
+    fetch_tile,
+    load_layer,
+    load_scan,
+    parse_entity_tag,
+    prepare_layer,
+    prune_cache,
+    render_map,
+    render_pdf,
+    scan_grid,
+    scan_table,
+    scan_tasks,
+    scan_tile,
+)
 
 # Extracted color palette from the logo.png
 PRIMARY_COLOR = "#164031"   # dark green
@@ -20,6 +43,15 @@ BACKGROUND_COLOR = "#f0ecdf" # background color from the image
 RADIUS = 1000
 DEFAULT_COORDINATES = (48.36964, 14.5128)
 API_URL = "https://www.chatbase.co/api/v1/chat"
+MAP_WIDTH = 700
+MAP_HEIGHT = 500
+
+SCAN_CELL_SIZES = [250, 500, 1000]  # meters
+# Each 8x8-cell tile is one Overpass query, so this caps a scan at about 40 queries by default
+MAX_SCAN_CELLS = int(os.environ.get("TA_MAX_SCAN_CELLS", "2500"))
+
+# Number of worker processes for heavy work; 0 keeps everything in the Streamlit process
+WORKER_PROCESSES = int(os.environ.get("TA_WORKER_PROCESSES", "0"))
 
 DIMENSION_COLORS = {
     "Default": ACCENT_COLOR,
@@ -69,12 +101,155 @@ villages_coordinates = {
 }
 
 
+# SMART dimensions and the OSM tags that indicate them
+smart_entities_options = {
+    "SmartEconomy": [
+        "POI", "amenity=marketplace", "amenity=vending_machine", "building=commercial",
+        "man_made=offshore_platform", "man_made=petroleum_well", "man_made=pipeline", "man_made=works", "office=company",
+        "office=coworking", "shop=all", "tourism=alpine_hut", "tourism=attraction", "tourism=camp_pitch", "tourism=camp_site",
+        "tourism=caravan_site", "building=chalet", "building=guest_house", "building=hostel", "building=hotel", "tourism=information",
+        "tourism=motel", "building=museum", "tourism=wilderness_hut",
+    ],
+    "SmartGovernance": ["amenity=townhall", "amenity=courthouse", "amenity=police", "amenity=fire_station", "building=government"],
+    "SmartMobility": [
+        "barrier=bump_gate", "barrier=bus_trap", "barrier=cycle_barrier", "barrier=motorcycle_barrier",
+        "barrier=sump_buster", "building=train_station", "building=transportation", "building=parking",
+        "highway=motorway", "public_transport=all", "railway=all", "route=all",
+    ],
+    "SmartEnvironment": [
+        "amenity=recycling", "boundary=forest", "boundary=forest_compartment", "boundary=hazard",
+        "boundary=national_park", "boundary=protected_area", "leisure=garden", "leisure=nature_reserve",
+        "leisure=park", "man_made=gasometer", "man_made=mineshaft", "man_made=wastewater_plant",
+        "man_made=water_works", "natural=grass", "water=river",
+    ],
+    "SmartPeople": [
+        "amenity=college", "amenity=kindergarten", "amenity=school", "amenity=university",
+        "office=educational_institution", "office=employment_agency", "amenity=refugee_site",
+    ],
+    "SmartLiving": [
+        "amenity=internet_cafe", "amenity=public_bath", "amenity=vending_machine",
+        "amenity=water_point", "amenity=hospital", "amenity=museum",
+        "amenity=place_of_worship", "amenity=fire_station", "amenity=toilets",
+    ],
+}
+
+# Every distinct SMART tag, in dimension order, for area scans
+ALL_SMART_TAGS = list(dict.fromkeys(tag for tags in smart_entities_options.values() for tag in tags))
+
+
+@st.cache_resource
+def get_worker_pool() -> ProcessPoolExecutor | None:
+    """Create the process pool shared by all sessions, or None when disabled."""
+    if WORKER_PROCESSES <= 0:
+        return None
+    # Forking Streamlit's multi-threaded server can copy held locks into the children
+    return ProcessPoolExecutor(max_workers=WORKER_PROCESSES, mp_context=multiprocessing.get_context("spawn"))
+
+
+@st.cache_resource
+def get_pool_lock() -> threading.Lock:
+    """Create the lock that serializes replacing a broken worker pool across sessions."""
+    return threading.Lock()
+
+
+def replace_broken_pool(broken: ProcessPoolExecutor) -> ProcessPoolExecutor | None:
+    """Swap a broken shared pool for a fresh one, unless another session already did."""
+    with get_pool_lock():
+        if get_worker_pool() is broken:
+            broken.shutdown(wait=False)
+            get_worker_pool.clear()
+        return get_worker_pool()
+
+
+def run_in_pool(func: Callable[..., None], *args: Any) -> None:
+    """Run func in the worker pool when one is configured, otherwise inline."""
+    pool = get_worker_pool()
+    if pool is None:
+        func(*args)
+        return
+    try:
+        pool.submit(func, *args).result()
+    except BrokenProcessPool:
+        # A crashed worker breaks the shared pool for every session; replace it and retry once
+        pool = replace_broken_pool(pool)
+        if pool is None:
+            func(*args)
+        else:
+            pool.submit(func, *args).result()
+
+
+def touch_cached(path: Path) -> bool:
+    """Mark a cached file as recently used; False if it is missing or was just evicted."""
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def run_heavy(path: Path, func: Callable[..., None], *args: Any) -> Path:
+    """Produce a cached result with func, in the worker pool when one is configured."""
+    if touch_cached(path):
+        return path
+    run_in_pool(func, path, *args)
+    prune_cache(path.parent.name)
+    return path
+
+
+def fetch_entities(
+    latitude: float,
+    longitude: float,
+    tags: dict[str, Any],
+    radius: int,
+    entity_type: str,
+    layer_name: str,
+    marker_color: str,
+) -> pd.DataFrame:
+    """Fetch an annotated entity layer through the shared cache.
+
+    Geometries stay in the cached layer for map rendering; the copy kept in
+    session state is loaded from a geometry-free attribute file.
+    """
+    key = cache_key(LAYER_SCHEMA_VERSION, latitude, longitude, tags, radius, entity_type, layer_name, marker_color)
+    path = cache_path("layers", key, ".pkl")
+    attributes_path = cache_path("layer_attributes", key, ".pkl")
+    if not (touch_cached(path) and touch_cached(attributes_path)):
+        with st.spinner("Fetching data…"):
+            # Overpass I/O stays in this session's thread so slow queries do not hold pool workers
+            features = fetch_features(latitude, longitude, tags, radius)
+            run_in_pool(prepare_layer, path, attributes_path, features, entity_type, layer_name, marker_color)
+        prune_cache("layers")
+        prune_cache("layer_attributes")
+    entities = load_layer(attributes_path)
+    entities.attrs["cache_path"] = str(path)
+    entities.attrs["fetch_args"] = (latitude, longitude, tags, radius, entity_type, layer_name, marker_color)
+    return entities
+
+
+def ensure_layer(entities: pd.DataFrame) -> Path:
+    """Return the cached layer path of a session layer, refetching it if it was evicted."""
+    path = Path(entities.attrs["cache_path"])
+    if not touch_cached(path):
+        fetch_entities(*entities.attrs["fetch_args"])
+    return path
+
+
+def current_scan_path() -> Path | None:
+    """Return the session's scan path, dropping it with a warning if it was evicted."""
+    if not st.session_state.scan_path:
+        return None
+    path = Path(st.session_state.scan_path)
+    if not path.exists():
+        st.session_state.scan_path = None
+        st.warning("The area scan is no longer cached. Run the scan again to restore the coverage grid.")
+        return None
+    return path
+
+
 def get_amenities(latitude: float, longitude: float, amenity_type: str = "all", radius: int = RADIUS) -> pd.DataFrame:
     """Fetch amenities around the given latitude and longitude."""
     tags = {"amenity": True} if amenity_type == "all" else {"amenity": amenity_type}
-    with st.spinner("Fetching data…"):
-        amenities = ox.features_from_point((latitude, longitude), tags=tags, dist=radius)
-    return amenities
+    return fetch_entities(latitude, longitude, tags, radius, amenity_type, "Default", DIMENSION_COLORS["Default"])
 
 
 def count_entities(entities: pd.DataFrame) -> dict[str, int]:
@@ -112,83 +287,50 @@ def count_amenities(latitude: float, longitude: float, radius: int = RADIUS) ->
     return amenity_counts.to_dict()
 
 
-def get_smart_entities(latitude: float, longitude: float, ent: str, radius: int = RADIUS) -> pd.DataFrame:
+def get_smart_entities(
+    latitude: float,
+    longitude: float,
+    ent: str,
+    radius: int = RADIUS,
+    layer_name: str = "Default",
+    marker_color: str = ACCENT_COLOR,
+) -> pd.DataFrame:
     """Fetch entities of a specific type around the given latitude and longitude."""
-    if "=" in ent:
-        key, value = ent.split("=", maxsplit=1)
-    else:
-        key, value = "name", ent
+    key, value = parse_entity_tag(ent)
     tags = {key: True} if value == "all" else {key: value}
-    with st.spinner("Fetching data…"):
-        entities = ox.features_from_point((latitude, longitude), tags=tags, dist=radius)
-    entities["entity_type"] = ent
-    return entities
-
+    return fetch_entities(latitude, longitude, tags, radius, ent, layer_name, marker_color)
 
-def add_markers_to_map(
-    m: folium.Map,
-    entities: pd.DataFrame,
-    entity_type: str,
-    color: str,
-    layer_name: str,
-) -> None:
-    """Add markers to the map for entities using the provided color and layer."""
-    feature_group = folium.FeatureGroup(name=layer_name, show=True)
-
-    for _, row in entities.iterrows():
-        geometry = row.get("geometry")
-        if geometry is None:
-            continue
-
-        if geometry.geom_type == "Point":
-            point_location = [geometry.y, geometry.x]
-        elif geometry.geom_type in {"Polygon", "MultiPolygon", "LineString", "MultiLineString"}:
-            centroid = geometry.centroid
-            point_location = [centroid.y, centroid.x]
-        else:
-            continue
 
-        tooltip = f"{entity_type}: {row.get('name', 'N/A')}"
-        folium.CircleMarker(
-            location=point_location,
-            radius=8,
-            popup=tooltip,
-            color=color,
-            fill=True,
-            fill_color=color,
-            fill_opacity=0.8,
-        ).add_to(feature_group)
-
-    feature_group.add_to(m)
+def scan_smart_area(bbox: tuple[float, float, float, float], cell_size: int) -> Path:
+    """Scan a bounding box for all SMART tags and return the cached scan path."""
+    rows, cols, _, _ = scan_grid(bbox, cell_size)
+    if rows * cols > MAX_SCAN_CELLS:
+        raise ValueError(
+            f"The area spans {rows * cols} cells; reduce it or use larger cells (limit {MAX_SCAN_CELLS})."
+        )
+    path = cache_path("scans", cache_key(bbox, cell_size, ALL_SMART_TAGS), ".npz")
+    if touch_cached(path):
+        return path
+
+    # Overpass queries run in this thread and only the counting goes to the pool, one task per tile
+    tasks = scan_tasks(bbox, cell_size, ALL_SMART_TAGS)
+    progress = st.progress(0.0, text="Scanning area…")
+    task_paths = []
+    for done, (tile, tag_indices) in enumerate(tasks, start=1):
+        task_path = cache_path("scan_tiles", cache_key(bbox, cell_size, ALL_SMART_TAGS, tile, tag_indices), ".npy")
+        if not touch_cached(task_path):
+            features = fetch_tile(bbox, cell_size, ALL_SMART_TAGS, tile, tag_indices)
+            run_heavy(task_path, scan_tile, bbox, cell_size, ALL_SMART_TAGS, tile, tag_indices, features)
+        task_paths.append((tile, tag_indices, task_path))
+        progress.progress(done / len(tasks), text=f"Scanning area… tile {done}/{len(tasks)}")
+    progress.empty()
+    return run_heavy(path, assemble_scan, bbox, cell_size, ALL_SMART_TAGS, task_paths)
 
 
 def generate_pdf(text: str) -> io.BytesIO:
     """Generate an in-memory PDF from the provided text."""
-    pdf = FPDF()
-    pdf.add_page()
-    pdf.set_auto_page_break(auto=True, margin=15)
-    pdf.set_left_margin(15)
-    pdf.set_right_margin(15)
-    pdf.set_font("Arial", size=12)
-
-    line_height = pdf.font_size * 2.5
-
-    for line in text.split("\n"):
-        words = line.split(" ")
-        current_line = ""
-        for word in words:
-            if pdf.get_string_width(current_line + word) < (pdf.w - pdf.l_margin - pdf.r_margin):
-                current_line += f"{word} "
-            else:
-                pdf.cell(0, line_height, txt=current_line.strip(), new_x="LMARGIN", new_y="NEXT")
-                current_line = f"{word} "
-        pdf.cell(0, line_height, txt=current_line.strip(), new_x="LMARGIN", new_y="NEXT")
-
-    raw_output: Any = pdf.output(dest="S")
-    if isinstance(raw_output, str):
-        raw_output = raw_output.encode("latin-1")
-
-    buffer = io.BytesIO(bytes(raw_output))
+    path = run_heavy(cache_path("pdf", cache_key(text), ".pdf"), render_pdf, text)
+    buffer = io.BytesIO(path.read_bytes())
     buffer.seek(0)
     return buffer
 
@@ -232,6 +374,8 @@ def initialize_session_state() -> None:
         st.session_state.selected_entities = []
     if "message_content" not in st.session_state:
         st.session_state.message_content = ""
+    if "scan_path" not in st.session_state:
+        st.session_state.scan_path = None
 
 
 def get_api_config() -> tuple[dict[str, str] | None, str | None]:
@@ -282,20 +426,25 @@ def render_entity_chart(entity_counts: dict[str, int]) -> None:
         st.bar_chart(chart_df.set_index("Entity Type"), color=SECONDARY_COLOR)
 
 
-def build_map(lat: float, lon: float) -> folium.Map:
-    """Create map and redraw all selected entity layers from session state."""
-    m = folium.Map(location=[lat, lon], zoom_start=14)
-
-    for entities in st.session_state.selected_entities:
-        if entities.empty:
-            continue
-        entity_type = str(entities.get("entity_type", pd.Series(["unknown"])).iloc[0])
-        layer_name = str(entities.get("layer_name", pd.Series(["Default"])).iloc[0])
-        marker_color = str(entities.get("marker_color", pd.Series([ACCENT_COLOR])).iloc[0])
-        add_markers_to_map(m, entities, entity_type, marker_color, layer_name)
-
-    folium.LayerControl(collapsed=False).add_to(m)
-    return m
+def build_map(lat: float, lon: float, shapes: bool = False, coverage_tag: str | None = None) -> str:
+    """Render the map HTML with all selected entity layers and area scan from session state."""
+    layer_paths = [ensure_layer(entities) for entities in st.session_state.selected_entities]
+    scan_path = current_scan_path()
+    key = cache_key(
+        lat, lon, shapes, [path.name for path in layer_paths], scan_path.name if scan_path else None, coverage_tag
+    )
+    path = run_heavy(
+        cache_path("maps", key, ".html"),
+        render_map,
+        lat,
+        lon,
+        layer_paths,
+        ACCENT_COLOR,
+        shapes,
+        scan_path,
+        coverage_tag,
+    )
+    return path.read_text(encoding="utf-8")
 
 
 def main() -> None:
@@ -329,47 +478,22 @@ def main() -> None:
     st.image("logo.png", width=200)
     st.markdown(f"<h1 style='color: {SECONDARY_COLOR};'>TA Analyzer</h1>", unsafe_allow_html=True)
 
-    smart_entities_options = {
-        "SmartEconomy": [
-            "POI", "amenity=marketplace", "amenity=vending_machine", "building=commercial",
-            "man_made=offshore_platform", "man_made=petroleum_well", "man_made=pipeline", "man_made=works", "office=company",
-            "office=coworking", "shop=all", "tourism=alpine_hut", "tourism=attraction", "tourism=camp_pitch", "tourism=camp_site",
-            "tourism=caravan_site", "building=chalet", "building=guest_house", "building=hostel", "building=hotel", "tourism=information",
-            "tourism=motel", "building=museum", "tourism=wilderness_hut",
-        ],
-        "SmartGovernance": ["amenity=townhall", "amenity=courthouse", "amenity=police", "amenity=fire_station", "building=government"],
-        "SmartMobility": [
-            "barrier=bump_gate", "barrier=bus_trap", "barrier=cycle_barrier", "barrier=motorcycle_barrier",
-            "barrier=sump_buster", "building=train_station", "building=transportation", "building=parking",
-            "highway=motorway", "public_transport=all", "railway=all", "route=all",
-        ],
-        "SmartEnvironment": [
-            "amenity=recycling", "boundary=forest", "boundary=forest_compartment", "boundary=hazard",
-            "boundary=national_park", "boundary=protected_area", "leisure=garden", "leisure=nature_reserve",
-            "leisure=park", "man_made=gasometer", "man_made=mineshaft", "man_made=wastewater_plant",
-            "man_made=water_works", "natural=grass", "water=river",
-        ],
-        "SmartPeople": [
-            "amenity=college", "amenity=kindergarten", "amenity=school", "amenity=university",
-            "office=educational_institution", "office=employment_agency", "amenity=refugee_site",
-        ],
-        "SmartLiving": [
-            "amenity=internet_cafe", "amenity=public_bath", "amenity=vending_machine",
-            "amenity=water_point", "amenity=hospital", "amenity=museum",
-            "amenity=place_of_worship", "amenity=fire_station", "amenity=toilets",
-        ],
-    }
-
     with st.sidebar:
         st.header("Controls")
         example_choice = st.selectbox("Choose a Test Area:", list(villages_coordinates.keys()), key="example_choice")
         selected_coordinate = villages_coordinates[example_choice]
         lat = st.number_input("Enter the latitude of the area:", value=selected_coordinate[0])
         lon = st.number_input("Enter the longitude of the area:", value=selected_coordinate[1])
+        render_shapes = st.checkbox(
+            "Render areas as shapes",
+            key="render_shapes",
+            help="Draw parks, forests, rivers and other areas as simplified outlines instead of centroid markers.",
+        )
 
         if st.button("🗑 Clear All Layers", key="clear_layers"):
             st.session_state.selected_entities = []
             st.session_state.message_content = ""
+            st.session_state.scan_path = None
             st.rerun()
 
         tab_names = ["Default", "SmartEconomy", "SmartGovernance", "SmartMobility", "SmartEnvironment", "SmartPeople", "SmartLiving"]
@@ -382,9 +506,6 @@ def main() -> None:
             if st.button("Show Amenities", key="amenity"):
                 try:
                     amenities = get_amenities(lat, lon, amenity_type, RADIUS)
-                    amenities["entity_type"] = amenity_type
-                    amenities["layer_name"] = "Default"
-                    amenities["marker_color"] = DIMENSION_COLORS["Default"]
                     st.session_state.selected_entities.append(amenities)
                     update_message_content(lat, lon)
                 except Exception as e:
@@ -402,14 +523,34 @@ def main() -> None:
                 )
                 if st.button(f"Show Selected Entities for {tab_name}", key=f"tab{i}"):
                     try:
-                        entities = get_smart_entities(lat, lon, selected_entity, RADIUS)
-                        entities["layer_name"] = tab_name
-                        entities["marker_color"] = DIMENSION_COLORS[tab_name]
+                        entities = get_smart_entities(
+                            lat, lon, selected_entity, RADIUS, tab_name, DIMENSION_COLORS[tab_name]
+                        )
                         st.session_state.selected_entities.append(entities)
                         update_message_content(lat, lon)
                     except Exception as e:
                         st.error(f"An error occurred: {str(e)}")
 
+        with st.expander("Area Scan"):
+            st.caption("Count every SMART tag per grid cell over a bounding box.")
+            south = st.number_input("South latitude:", value=lat - 0.02, format="%.4f")
+            west = st.number_input("West longitude:", value=lon - 0.03, format="%.4f")
+            north = st.number_input("North latitude:", value=lat + 0.02, format="%.4f")
+            east = st.number_input("East longitude:", value=lon + 0.03, format="%.4f")
+            cell_size = st.selectbox("Cell size (m):", SCAN_CELL_SIZES, index=1, key="scan_cell_size")
+
+            if st.button("Scan Area", key="scan_area"):
+                if south >= north or west >= east:
+                    st.warning("South/west must be smaller than north/east.")
+                else:
+                    try:
+                        st.session_state.scan_path = str(scan_smart_area((south, west, north, east), cell_size))
+                    except Exception as e:
+                        st.error(f"An error occurred: {str(e)}")
+
+            coverage_choice = st.selectbox("Coverage tag:", ["All SMART tags", *ALL_SMART_TAGS], key="coverage_tag")
+            coverage_tag = None if coverage_choice == "All SMART tags" else coverage_choice
+
     combined_entities = (
         pd.concat(st.session_state.selected_entities, ignore_index=False)
         if st.session_state.selected_entities
@@ -429,8 +570,24 @@ def main() -> None:
         st.subheader("Entity Distribution")
         render_entity_chart(entity_counts)
 
-    m = build_map(lat, lon)
-    folium_static(m)
+    map_html = build_map(lat, lon, render_shapes, coverage_tag)
+    components.html(map_html, width=MAP_WIDTH, height=MAP_HEIGHT + 10)
+
+    scan_path = current_scan_path()
+    if scan_path is not None:
+        scan_cells = scan_table(load_scan(scan_path))
+        tag_totals = scan_cells[ALL_SMART_TAGS].sum()
+        st.subheader("Area Scan")
+        st.dataframe(
+            tag_totals[tag_totals > 0].sort_values(ascending=False).rename("Count").rename_axis("Tag"),
+            use_container_width=True,
+        )
+        st.download_button(
+            "Download Cell Counts as CSV",
+            data=scan_cells.to_csv(index=False),
+            file_name="smart_area_scan.csv",
+            mime="text/csv",
+        )
 
     st.subheader("AI Assistant")
     api_headers, chatbot_id = get_api_config()
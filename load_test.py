@@ -0,0 +1,121 @@
+"""Local load-test harness simulating concurrent TA Analyzer sessions.
+
+Streamlit serves every session from a thread of one process, so each simulated
+session here is a thread that fetches layers, renders the map and generates a
+PDF through the app's own run_heavy/get_worker_pool path, either inline
+(GIL-bound) or through the shared process pool. Overpass is replaced by a
+synthetic feature generator so only local CPU work is measured.
+
+Usage:
+    python load_test.py --sessions 40 --workers 4
+"""
+
+import argparse
+import logging
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any
+
+import geopandas as gpd
+import osmnx as ox
+from shapely.geometry import Point
+
+import app
+import workers
+
+FEATURES_PER_LAYER = 400
+SESSION_LAYERS = ["amenity=school", "leisure=park", "amenity=toilets"]
+REPORT_TEXT = "The village shows a moderate level of digitalization with room for improvement. " * 60
+
+
+def synthetic_features_from_point(center_point: tuple[float, float], tags: dict[str, Any], dist: int) -> gpd.GeoDataFrame:
+    """Stand-in for ox.features_from_point returning points and polygons around the center."""
+    latitude, longitude = center_point
+    rng = random.Random(f"{center_point}{sorted(tags.items())}")
+    key, value = next(iter(tags.items()))
+    geometries = []
+    for i in range(FEATURES_PER_LAYER):
+        point = Point(longitude + rng.uniform(-0.01, 0.01), latitude + rng.uniform(-0.01, 0.01))
+        geometries.append(point if i % 2 else point.buffer(0.0005))
+    return gpd.GeoDataFrame(
+        {
+            "name": [f"feature {i}" for i in range(FEATURES_PER_LAYER)],
+            key: "yes" if value is True else value,
+        },
+        geometry=geometries,
+        crs="EPSG:4326",
+    )
+
+
+# Fetches run in the session threads of this process, so patching osmnx here is enough
+ox.features_from_point = synthetic_features_from_point
+
+
+def run_session(session_id: int) -> float:
+    """Run one simulated session and return its latency in seconds."""
+    latitude, longitude = 46.3087 + session_id * 0.001, 10.7488
+
+    start = time.perf_counter()
+    layers = [
+        app.get_smart_entities(latitude, longitude, ent, app.RADIUS, "SmartPeople", "#ff9800")
+        for ent in SESSION_LAYERS
+    ]
+    layer_paths = [app.ensure_layer(entities) for entities in layers]
+    map_path = workers.cache_path("maps", workers.cache_key(session_id, latitude, longitude), ".html")
+    app.run_heavy(map_path, workers.render_map, latitude, longitude, layer_paths, app.ACCENT_COLOR, True)
+    map_path.read_text(encoding="utf-8")
+    app.generate_pdf(f"Session {session_id}\n{REPORT_TEXT}")
+    return time.perf_counter() - start
+
+
+def run_load_test(sessions: int, worker_processes: int) -> list[float]:
+    """Run all sessions concurrently and return their latencies."""
+    app.WORKER_PROCESSES = worker_processes
+    app.get_worker_pool.clear()
+    try:
+        with ThreadPoolExecutor(max_workers=sessions) as threads:
+            return list(threads.map(run_session, range(sessions)))
+    finally:
+        pool = app.get_worker_pool()
+        if pool is not None:
+            pool.shutdown()
+        app.get_worker_pool.clear()
+
+
+def main() -> None:
+    """Compare inline and process-pool serving for N concurrent sessions."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=40, help="number of concurrent sessions")
+    parser.add_argument("--workers", type=int, default=4, help="worker processes for the pooled run")
+    args = parser.parse_args()
+
+    # Streamlit warns about the missing script run context on every call in bare mode
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+    for name in list(logging.root.manager.loggerDict):
+        if name.startswith("streamlit"):
+            logging.getLogger(name).setLevel(logging.ERROR)
+
+    print(f"CPUs available: {os.cpu_count()}")
+    cache_dir = Path(tempfile.mkdtemp(prefix="ta_load_test_"))
+    try:
+        for label, worker_processes in (("inline", 0), (f"{args.workers} workers", args.workers)):
+            workers.SHARED_CACHE_DIR = cache_dir / label.replace(" ", "_")
+            start = time.perf_counter()
+            latencies = run_load_test(args.sessions, worker_processes)
+            wall = time.perf_counter() - start
+            print(
+                f"{label:>12}: wall {wall:6.2f}s  "
+                f"median {statistics.median(latencies):6.2f}s  max {max(latencies):6.2f}s"
+            )
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+import app
+import workers
+
+
+def write_result(path, text):
+    workers.write_atomic(path, text.encode("utf-8"))
+
+
+class InlinePool:
+    def __init__(self):
+        self.submitted = 0
+        self.shut_down = False
+
+    def submit(self, func, *args):
+        self.submitted += 1
+        future = Future()
+        func(*args)
+        future.set_result(None)
+        return future
+
+    def shutdown(self, wait=True):
+        self.shut_down = True
+
+
+class BrokenPool(InlinePool):
+    def submit(self, func, *args):
+        self.submitted += 1
+        raise BrokenProcessPool("worker died")
+
+
+class FakePoolFactory:
+    """Stand-in for the cached get_worker_pool that hands out pools in order."""
+
+    def __init__(self, *pools):
+        self.pools = list(pools)
+        self.clears = 0
+
+    def __call__(self):
+        return self.pools[0]
+
+    def clear(self):
+        self.clears += 1
+        self.pools.pop(0)
+
+
+@pytest.fixture(autouse=True)
+def shared_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(workers, "SHARED_CACHE_DIR", tmp_path)
+    return tmp_path
+
+
+def test_run_heavy_inline_produces_result(monkeypatch):
+    monkeypatch.setattr(app, "WORKER_PROCESSES", 0)
+    app.get_worker_pool.clear()
+    path = workers.cache_path("maps", "key", ".html")
+
+    assert app.run_heavy(path, write_result, "map") == path
+    assert path.read_text() == "map"
+
+
+def test_run_heavy_returns_cached_result_without_running(monkeypatch):
+    pool = InlinePool()
+    monkeypatch.setattr(app, "get_worker_pool", FakePoolFactory(pool))
+    path = workers.cache_path("pdf", "key", ".pdf")
+    write_result(path, "cached")
+
+    app.run_heavy(path, write_result, "fresh")
+
+    assert path.read_text() == "cached"
+    assert pool.submitted == 0
+
+
+def test_run_heavy_recomputes_result_evicted_after_check(monkeypatch):
+    monkeypatch.setattr(app, "get_worker_pool", FakePoolFactory(InlinePool()))
+    path = workers.cache_path("maps", "key", ".html")
+
+    def evicted_utime(target):
+        raise FileNotFoundError(target)
+
+    monkeypatch.setattr(app.os, "utime", evicted_utime)
+    app.run_heavy(path, write_result, "fresh")
+
+    assert path.read_text() == "fresh"
+
+
+def test_run_heavy_replaces_broken_pool_and_retries(monkeypatch):
+    broken, fresh = BrokenPool(), InlinePool()
+    factory = FakePoolFactory(broken, fresh)
+    monkeypatch.setattr(app, "get_worker_pool", factory)
+    path = workers.cache_path("maps", "key", ".html")
+
+    app.run_heavy(path, write_result, "retried")
+
+    assert path.read_text() == "retried"
+    assert broken.shut_down and factory.clears == 1
+    assert fresh.submitted == 1
+
+
+def test_replace_broken_pool_keeps_pool_already_replaced(monkeypatch):
+    broken, replacement = BrokenPool(), InlinePool()
+    factory = FakePoolFactory(replacement)
+    monkeypatch.setattr(app, "get_worker_pool", factory)
+
+    assert app.replace_broken_pool(broken) is replacement
+    assert factory.clears == 0
+    assert not replacement.shut_down
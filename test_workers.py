@@ -0,0 +1,210 @@
+import os
+
+import geopandas as gpd
+import numpy as np
+import pytest
+from shapely.geometry import LineString, Point, Polygon, box
+
+import workers
+
+
+def make_entities(geometries: list, names: list[str] | None = None) -> gpd.GeoDataFrame:
+    names = names or [f"feature {i}" for i in range(len(geometries))]
+    entities = gpd.GeoDataFrame({"name": names}, geometry=geometries, crs="EPSG:4326")
+    entities["marker_lat"] = [geometry.centroid.y for geometry in geometries]
+    entities["marker_lon"] = [geometry.centroid.x for geometry in geometries]
+    return entities
+
+
+def test_write_atomic_removes_temp_file_on_failure(tmp_path, monkeypatch):
+    def failing_replace(src, dst):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(workers.os, "replace", failing_replace)
+    with pytest.raises(OSError):
+        workers.write_atomic(tmp_path / "maps" / "map.html", b"<html></html>")
+    assert list((tmp_path / "maps").iterdir()) == []
+
+
+def test_prune_cache_evicts_least_recently_used(tmp_path, monkeypatch):
+    monkeypatch.setattr(workers, "SHARED_CACHE_DIR", tmp_path)
+    monkeypatch.setattr(workers, "CACHE_LIMITS", {"maps": 2})
+    directory = tmp_path / "maps"
+    directory.mkdir()
+    for age, name in enumerate(["recent.html", "stale.html", "touched.html", "writing.tmp"]):
+        (directory / name).write_text(name)
+        os.utime(directory / name, (1000 - age * 100, 1000 - age * 100))
+    os.utime(directory / "touched.html", (2000, 2000))
+
+    workers.prune_cache("maps")
+
+    assert sorted(path.name for path in directory.iterdir()) == ["recent.html", "touched.html", "writing.tmp"]
+
+
+def test_prune_cache_ignores_kinds_without_limit(tmp_path, monkeypatch):
+    monkeypatch.setattr(workers, "SHARED_CACHE_DIR", tmp_path)
+    monkeypatch.setattr(workers, "CACHE_LIMITS", {"maps": 0})
+    (tmp_path / "layers").mkdir()
+    (tmp_path / "layers" / "layer.pkl").write_bytes(b"")
+
+    workers.prune_cache("layers")
+    workers.prune_cache("missing")
+
+    assert (tmp_path / "layers" / "layer.pkl").exists()
+
+
+def decode_arc(arc: list[list[int]], transform: dict) -> np.ndarray:
+    positions = np.cumsum(np.array(arc), axis=0)
+    return positions * np.array(transform["scale"]) + np.array(transform["translate"])
+
+
+def test_quantize_arc_round_trips_and_drops_repeats():
+    coords = [(0.2, 0.4), (3.1, 0.4), (2.9, 0.3), (3.4, 5.2), (-1.6, 2.0)]
+    arc = workers.quantize_arc(coords)
+    assert arc[0] == [0, 0]
+    assert np.cumsum(np.array(arc), axis=0).tolist() == [[0, 0], [3, 0], [3, 5], [-2, 2]]
+
+
+def test_build_topology_round_trips_within_one_pixel():
+    polygon = Polygon([(10.0, 64.0), (10.02, 64.0), (10.02, 64.01), (10.0, 64.01)])
+    line = LineString([(10.0, 64.0), (10.01, 64.005), (10.03, 64.02)])
+    entities = make_entities([polygon, line])
+
+    topology, encoded = workers.build_topology(entities, "leisure=park", zoom=14)
+
+    assert encoded == {0, 1}
+    transform = topology["transform"]
+    scale_x, scale_y = transform["scale"]
+    assert scale_y == pytest.approx(scale_x * np.cos(np.radians(64.01)), rel=1e-3)
+    ring = decode_arc(topology["arcs"][0], transform)
+    assert (np.abs(ring - np.array(polygon.exterior.coords)).max(axis=0) <= np.array([scale_x, scale_y])).all()
+    polyline = decode_arc(topology["arcs"][1], transform)
+    assert polyline[0] == pytest.approx(line.coords[0], abs=scale_x)
+    assert polyline[-1] == pytest.approx(line.coords[-1], abs=scale_x)
+
+
+def test_build_topology_skips_degenerate_geometries():
+    tiny_square = box(10.0, 46.0, 10.00002, 46.00002)
+    zero_length_line = LineString([(10.001, 46.001), (10.001, 46.001)])
+    park = Point(10.002, 46.002).buffer(0.003)
+    entities = make_entities([tiny_square, zero_length_line, park, Point(10.0, 46.0)])
+
+    topology, encoded = workers.build_topology(entities, "leisure=park", zoom=14)
+
+    assert encoded == {2}
+    assert len(topology["objects"]["shapes"]["geometries"]) == 1
+    assert workers.build_topology(entities.iloc[[0, 3]], "leisure=park", zoom=14) == (None, set())
+
+
+def test_shape_mode_falls_back_to_markers_for_unencoded_shapes():
+    entities = make_entities([box(10.0, 46.0, 10.000002, 46.000002), Point(10.002, 46.002).buffer(0.003)])
+    m = workers.folium.Map(location=[46.0, 10.0], zoom_start=workers.MAP_ZOOM)
+
+    workers.add_markers_to_map(m, entities, "building=kiosk", "#ff0000", "SmartEconomy", shapes=True)
+
+    unencoded_bands = [
+        max_zoom
+        for _, max_zoom in workers.SHAPE_ZOOM_BANDS
+        if 0 not in workers.build_topology(entities, "building=kiosk", max_zoom)[1]
+    ]
+    assert workers.SHAPE_ZOOM_BANDS[0][1] in unencoded_bands
+    html = m.get_root().render()
+    assert html.count("L.circleMarker(") == len(unencoded_bands)
+    assert html.count("topojson.feature(") == len(workers.SHAPE_ZOOM_BANDS)
+
+
+SCAN_BBOX = (46.0, 10.0, 46.0089, 10.0129)  # about 1 km square, 4 x 4 cells of 250 m
+
+
+def stub_features_from_polygon(features: gpd.GeoDataFrame):
+    def features_from_polygon(polygon, tags):
+        found = features[features.intersects(polygon)]
+        if found.empty:
+            raise type("InsufficientResponseError", (Exception,), {})("No matching features")
+        return found
+
+    return features_from_polygon
+
+
+def run_scan(tmp_path, monkeypatch, features: gpd.GeoDataFrame, entity_tags: list[str]) -> dict:
+    monkeypatch.setattr(workers, "SCAN_TILE_CELLS", 2)
+    monkeypatch.setattr(workers.ox, "features_from_polygon", stub_features_from_polygon(features))
+    task_paths = []
+    for index, (tile, tag_indices) in enumerate(workers.scan_tasks(SCAN_BBOX, 250, entity_tags)):
+        task_path = tmp_path / f"task{index}.npy"
+        features = workers.fetch_tile(SCAN_BBOX, 250, entity_tags, tile, tag_indices)
+        workers.scan_tile(task_path, SCAN_BBOX, 250, entity_tags, tile, tag_indices, features)
+        task_paths.append((tile, tag_indices, task_path))
+    workers.assemble_scan(tmp_path / "scan.npz", SCAN_BBOX, 250, entity_tags, task_paths)
+    return workers.load_scan(tmp_path / "scan.npz")
+
+
+def test_scan_tags_merges_all_values():
+    tags = workers.scan_tags(["amenity=school", "shop=bakery", "amenity=all", "amenity=police", "shop=bakery", "POI"])
+    assert tags == {"amenity": True, "shop": ["bakery"], "name": ["POI"]}
+
+
+def test_scan_grid_covers_bbox():
+    rows, cols, cell_lat, cell_lon = workers.scan_grid(SCAN_BBOX, 250)
+    assert (rows, cols) == (4, 4)
+    assert cell_lon > cell_lat
+    assert workers.scan_grid((46.0, 10.0, 46.0001, 10.0001), 1000)[:2] == (1, 1)
+
+
+def test_scan_tasks_fetch_area_keys_once(monkeypatch):
+    monkeypatch.setattr(workers, "SCAN_TILE_CELLS", 2)
+    tasks = workers.scan_tasks(SCAN_BBOX, 250, ["amenity=school", "boundary=protected_area", "route=all"])
+    assert tasks[0] == ((0, 4, 0, 4), [1, 2])
+    assert [tile for tile, _ in tasks[1:]] == [(0, 2, 0, 2), (0, 2, 2, 4), (2, 4, 0, 2), (2, 4, 2, 4)]
+    assert all(tag_indices == [0] for _, tag_indices in tasks[1:])
+
+
+def test_scan_counts_edge_crossing_feature_once_and_ignores_outside(tmp_path, monkeypatch):
+    _, _, cell_lat, cell_lon = workers.scan_grid(SCAN_BBOX, 250)
+    south, west = SCAN_BBOX[:2]
+    # Spans the boundary between the first and second tile columns (cells 1 and 2)
+    park = box(west + 1.5 * cell_lon, south + 0.2 * cell_lat, west + 2.2 * cell_lon, south + 0.8 * cell_lat)
+    school = Point(west + 3.5 * cell_lon, south + 3.5 * cell_lat)
+    outside_school = Point(west + 0.5 * cell_lon, south - 0.5 * cell_lat)
+    features = gpd.GeoDataFrame(
+        {"leisure": ["park", None, None], "amenity": [None, "school", "school"]},
+        geometry=[park, school, outside_school],
+        crs="EPSG:4326",
+    )
+
+    scan = run_scan(tmp_path, monkeypatch, features, ["leisure=park", "amenity=school", "amenity=all", "shop=all"])
+
+    counts = scan["counts"]
+    assert counts.shape == (4, 4, 4)
+    assert counts[0].sum() == 1
+    assert counts[1].sum() == 1 and counts[1, 3, 3] == 1
+    assert counts[2].sum() == 1
+    assert counts[3].sum() == 0
+    table = workers.scan_table(scan)
+    assert len(table) == 16
+    assert table["amenity=school"].sum() == 1
+
+
+def test_scan_counts_areas_and_lines_in_every_overlapped_cell(tmp_path, monkeypatch):
+    _, _, cell_lat, cell_lon = workers.scan_grid(SCAN_BBOX, 250)
+    south, west, north, east = SCAN_BBOX
+    protected_area = box(west - 0.01, south - 0.01, east + 0.01, north + 0.01)
+    # Runs along the middle of the first row and crosses the tile edge between columns 1 and 2
+    river = LineString([(west - 0.01, south + 0.5 * cell_lat), (east + 0.01, south + 0.5 * cell_lat)])
+    # Ends exactly on the edge between rows 1 and 2, so row 2 must not count it
+    forest = box(west + 0.5 * cell_lon, south + 0.2 * cell_lat, west + 2.5 * cell_lon, south + 2 * cell_lat)
+    features = gpd.GeoDataFrame(
+        {
+            "boundary": ["protected_area", None, "forest"],
+            "water": [None, "river", None],
+        },
+        geometry=[protected_area, river, forest],
+        crs="EPSG:4326",
+    )
+
+    scan = run_scan(tmp_path, monkeypatch, features, ["boundary=protected_area", "water=river", "boundary=forest"])
+
+    counts = scan["counts"]
+    assert (counts[0] == 1).all()
+    assert counts[1].tolist() == [[1, 1, 1, 1], [0, 0, 0, 0], [0, 0, 0, 0], [0, 0, 0, 0]]
+    assert counts[2].tolist() == [[1, 1, 1, 0], [1, 1, 1, 0], [0, 0, 0, 0], [0, 0, 0, 0]]
@@ -0,0 +1,660 @@
+"""CPU-heavy helpers for the TA Analyzer that can run in a process pool.
+
+Nothing in this module touches Streamlit, so every function can be pickled
+and executed by a worker process. Results are exchanged through a shared
+on-disk cache: a worker writes its output to a cache path and the Streamlit
+process only reads the finished file back.
+"""
+
+import hashlib
+import io
+import json
+import math
+import os
+import pickle
+import tempfile
+from pathlib import Path
+from typing import Any
+
+import folium
+import numpy as np
+import osmnx as ox
+import pandas as pd
+import shapely
+from branca.colormap import LinearColormap
+from branca.element import MacroElement
+from fpdf import FPDF
+from jinja2 import Template
+from shapely.affinity import affine_transform
+from shapely.geometry import box
+
+SHARED_CACHE_DIR = Path(os.environ.get("TA_SHARED_CACHE_DIR", "cache/shared"))
+# Most recently used files kept per cache kind; kinds not listed are never evicted
+CACHE_LIMITS = {"maps": 200, "pdf": 100, "layers": 1000, "layer_attributes": 1000, "scans": 50, "scan_tiles": 2000}
+# Bump when the cached layer columns change so stale pickles are not reused
+LAYER_SCHEMA_VERSION = 3
+MAP_ZOOM = 14
+# (min_zoom, max_zoom) ranges for shape layers; each is simplified for its max_zoom
+SHAPE_ZOOM_BANDS = ((0, 12), (13, 15), (16, 18))
+SHAPE_GEOMETRY_TYPES = {"Polygon", "MultiPolygon", "LineString", "MultiLineString"}
+SCAN_TILE_CELLS = 8  # grid cells per side of each fetched tile
+# OSM keys whose features are mostly large relations, fetched once per scan instead of per tile
+SCAN_AREA_KEYS = {"boundary", "route"}
+SCAN_COLORS = ("#d99115", "#164031")  # golden yellow to dark green, from the app palette
+METERS_PER_DEGREE = 111_320
+
+
+def cache_key(*parts: Any) -> str:
+    """Build a stable hash from JSON-serializable parts."""
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def cache_path(kind: str, key: str, suffix: str) -> Path:
+    """Return the shared cache location for a result of the given kind."""
+    return SHARED_CACHE_DIR / kind / f"{key}{suffix}"
+
+
+def write_atomic(path: Path, data: bytes) -> None:
+    """Write bytes so that concurrent readers never see a partial file."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as tmp_file:
+            tmp_file.write(data)
+        os.replace(tmp_name, path)
+    except BaseException:
+        if os.path.exists(tmp_name):
+            os.remove(tmp_name)
+        raise
+
+
+def prune_cache(kind: str) -> None:
+    """Evict the least recently used files of a cache kind beyond its limit."""
+    limit = CACHE_LIMITS.get(kind)
+    directory = SHARED_CACHE_DIR / kind
+    if limit is None or not directory.is_dir():
+        return
+    entries = []
+    for entry in os.scandir(directory):
+        if entry.name.endswith(".tmp"):
+            continue
+        try:
+            entries.append((entry.stat().st_mtime, entry.path))
+        except FileNotFoundError:
+            continue
+    entries.sort(reverse=True)
+    for _, stale_path in entries[limit:]:
+        try:
+            os.remove(stale_path)
+        except FileNotFoundError:
+            pass
+
+
+def load_layer(path: Path) -> pd.DataFrame:
+    """Load a fetched entity layer from the shared cache."""
+    with open(path, "rb") as layer_file:
+        return pickle.load(layer_file)
+
+
+def parse_entity_tag(ent: str) -> tuple[str, str]:
+    """Split an entity option such as 'amenity=school' into its OSM key and value."""
+    if "=" in ent:
+        key, value = ent.split("=", maxsplit=1)
+        return key, value
+    return "name", ent
+
+
+def fetch_features(latitude: float, longitude: float, tags: dict[str, Any], radius: int) -> pd.DataFrame:
+    """Fetch features around a point from Overpass.
+
+    This is network-bound, so callers run it in the session thread rather than
+    tying up a worker process while Overpass responds.
+    """
+    return ox.features_from_point((latitude, longitude), tags=tags, dist=radius)
+
+
+def prepare_layer(
+    path: Path,
+    attributes_path: Path,
+    entities: pd.DataFrame,
+    entity_type: str,
+    layer_name: str,
+    marker_color: str,
+) -> None:
+    """Annotate fetched features as a map layer and cache it with a geometry-free attribute copy."""
+    entities["entity_type"] = entity_type
+    entities["layer_name"] = layer_name
+    entities["marker_color"] = marker_color
+    centroids = [
+        None if geometry is None or geometry.is_empty else geometry.centroid for geometry in entities.geometry
+    ]
+    entities["marker_lat"] = [None if centroid is None else centroid.y for centroid in centroids]
+    entities["marker_lon"] = [None if centroid is None else centroid.x for centroid in centroids]
+    write_atomic(path, pickle.dumps(entities, protocol=pickle.HIGHEST_PROTOCOL))
+    attributes = pd.DataFrame(entities.drop(columns="geometry", errors="ignore"))
+    write_atomic(attributes_path, pickle.dumps(attributes, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def pixel_size(zoom: int, latitude: float) -> tuple[float, float]:
+    """Return the width and height in degrees of one Web Mercator tile pixel at the given zoom and latitude."""
+    width = 360 / (256 * 2**zoom)
+    return width, width * math.cos(math.radians(latitude))
+
+
+def quantize_arc(coords: Any) -> list[list[int]]:
+    """Round pixel-grid coordinates to integers and delta-encode them, dropping repeats."""
+    arc: list[list[int]] = []
+    prev_x = prev_y = 0
+    for x, y in coords:
+        qx, qy = round(x), round(y)
+        if arc and qx == prev_x and qy == prev_y:
+            continue
+        arc.append([qx - prev_x, qy - prev_y])
+        prev_x, prev_y = qx, qy
+    return arc
+
+
+def build_topology(
+    entities: pd.DataFrame, entity_type: str, zoom: int = MAP_ZOOM
+) -> tuple[dict[str, Any] | None, set[Any]]:
+    """Encode polygon and line geometries as a simplified, quantized TopoJSON topology.
+
+    Geometries are projected onto the pixel grid of the given zoom, simplified
+    with Douglas-Peucker at a one pixel tolerance and quantized to whole pixels.
+    Returns the topology and the index labels of the rows it encoded; features
+    that collapse below one pixel are left out of both.
+    """
+    shapes = entities[[getattr(g, "geom_type", None) in SHAPE_GEOMETRY_TYPES for g in entities.geometry]]
+    if shapes.empty:
+        return None, set()
+    minx, miny, _, maxy = shapes.total_bounds
+    scale_x, scale_y = pixel_size(zoom, (miny + maxy) / 2)
+    to_grid = [1 / scale_x, 0, 0, 1 / scale_y, -minx / scale_x, -miny / scale_y]
+    arcs: list[list[list[int]]] = []
+    geometries: list[dict[str, Any]] = []
+    encoded_labels: set[Any] = set()
+
+    def add_arc(coords: Any, min_points: int) -> int | None:
+        arc = quantize_arc(coords)
+        if len(arc) < min_points:
+            return None
+        arcs.append(arc)
+        return len(arcs) - 1
+
+    def encode_polygon(polygon: Any) -> list[list[int]] | None:
+        exterior = add_arc(polygon.exterior.coords, 4)
+        if exterior is None:
+            return None
+        rings = [[exterior]]
+        for interior in polygon.interiors:
+            index = add_arc(interior.coords, 4)
+            if index is not None:
+                rings.append([index])
+        return rings
+
+    for label, row in shapes.iterrows():
+        simplified = affine_transform(row["geometry"], to_grid).simplify(1, preserve_topology=True)
+        if simplified.is_empty:
+            continue
+
+        if simplified.geom_type == "Polygon":
+            encoded = encode_polygon(simplified)
+        elif simplified.geom_type == "MultiPolygon":
+            encoded = [rings for rings in map(encode_polygon, simplified.geoms) if rings] or None
+        elif simplified.geom_type == "LineString":
+            index = add_arc(simplified.coords, 2)
+            encoded = None if index is None else [index]
+        elif simplified.geom_type == "MultiLineString":
+            indices = [add_arc(line.coords, 2) for line in simplified.geoms]
+            encoded = [[index] for index in indices if index is not None] or None
+        else:
+            continue
+
+        if encoded is None:
+            continue
+        encoded_labels.add(label)
+        geometries.append(
+            {
+                "type": simplified.geom_type,
+                "arcs": encoded,
+                "properties": {"label": f"{entity_type}: {row.get('name', 'N/A')}"},
+            }
+        )
+
+    if not geometries:
+        return None, encoded_labels
+    topology = {
+        "type": "Topology",
+        "transform": {"scale": [scale_x, scale_y], "translate": [float(minx), float(miny)]},
+        "objects": {"shapes": {"type": "GeometryCollection", "geometries": geometries}},
+        "arcs": arcs,
+    }
+    return topology, encoded_labels
+
+
+class ZoomBands(MacroElement):
+    """Show each band layer of a feature group only within its zoom range."""
+
+    _template = Template(
+        """
+        {% macro script(this, kwargs) %}
+        (function() {
+            var map = {{ this.map.get_name() }};
+            var group = {{ this.group.get_name() }};
+            var bands = [
+                {% for band, min_zoom, max_zoom in this.bands %}
+                [{{ band.get_name() }}, {{ min_zoom }}, {{ max_zoom }}],
+                {% endfor %}
+            ];
+            function update() {
+                var zoom = map.getZoom();
+                bands.forEach(function(band) {
+                    var visible = zoom >= band[1] && zoom <= band[2];
+                    if (visible && !group.hasLayer(band[0])) { group.addLayer(band[0]); }
+                    if (!visible && group.hasLayer(band[0])) { group.removeLayer(band[0]); }
+                });
+            }
+            map.on("zoomend", update);
+            update();
+        })();
+        {% endmacro %}
+        """
+    )
+
+    def __init__(self, m: folium.Map, group: folium.FeatureGroup, bands: list[tuple[Any, int, int]]) -> None:
+        super().__init__()
+        self._name = "ZoomBands"
+        self.map = m
+        self.group = group
+        self.bands = bands
+
+
+def add_marker(group: Any, row: pd.Series, entity_type: str, color: str) -> None:
+    """Add a circle marker at a row's precomputed centroid."""
+    if pd.isna(row.get("marker_lat")) or pd.isna(row.get("marker_lon")):
+        return
+    tooltip = f"{entity_type}: {row.get('name', 'N/A')}"
+    folium.CircleMarker(
+        location=[row["marker_lat"], row["marker_lon"]],
+        radius=8,
+        popup=tooltip,
+        color=color,
+        fill=True,
+        fill_color=color,
+        fill_opacity=0.8,
+    ).add_to(group)
+
+
+def add_markers_to_map(
+    m: folium.Map,
+    entities: pd.DataFrame,
+    entity_type: str,
+    color: str,
+    layer_name: str,
+    shapes: bool = False,
+) -> None:
+    """Add markers to the map for entities using the provided color and layer.
+
+    With shapes enabled, polygons and lines are drawn as outlines simplified
+    for each of SHAPE_ZOOM_BANDS, and the map shows the band matching its
+    current zoom. Features too small to draw at a band get a centroid marker.
+    """
+    feature_group = folium.FeatureGroup(name=layer_name, show=True)
+    is_shape = pd.Series(
+        [getattr(g, "geom_type", None) in SHAPE_GEOMETRY_TYPES for g in entities.geometry], index=entities.index
+    )
+
+    for _, row in entities.iterrows():
+        geometry = row.get("geometry")
+        if geometry is None or geometry.geom_type not in SHAPE_GEOMETRY_TYPES | {"Point"}:
+            continue
+        if shapes and geometry.geom_type in SHAPE_GEOMETRY_TYPES:
+            continue
+        add_marker(feature_group, row, entity_type, color)
+
+    bands = []
+    if shapes and is_shape.any():
+        shape_entities = entities[is_shape.to_numpy()]
+        for min_zoom, max_zoom in SHAPE_ZOOM_BANDS:
+            band = folium.FeatureGroup(name=f"{layer_name} z{min_zoom}-{max_zoom}", control=False)
+            topology, encoded_labels = build_topology(shape_entities, entity_type, max_zoom)
+            if topology is not None:
+                folium.TopoJson(
+                    topology,
+                    "objects.shapes",
+                    style_function=lambda feature: {
+                        "color": color,
+                        "weight": 2,
+                        "fillColor": color,
+                        "fillOpacity": 0.3,
+                    },
+                    tooltip=folium.GeoJsonTooltip(fields=["label"], labels=False),
+                ).add_to(band)
+            for label, row in shape_entities.iterrows():
+                if label not in encoded_labels:
+                    add_marker(band, row, entity_type, color)
+            band.add_to(feature_group)
+            bands.append((band, min_zoom, max_zoom))
+
+    feature_group.add_to(m)
+    if bands:
+        ZoomBands(m, feature_group, bands).add_to(m)
+
+
+def render_map(
+    path: Path,
+    latitude: float,
+    longitude: float,
+    layer_paths: list[Path],
+    default_color: str,
+    shapes: bool = False,
+    scan_path: Path | None = None,
+    coverage_tag: str | None = None,
+) -> None:
+    """Draw all cached layers and an optional scan grid, and cache the rendered HTML."""
+    m = folium.Map(location=[latitude, longitude], zoom_start=MAP_ZOOM)
+
+    for layer_path in layer_paths:
+        entities = load_layer(layer_path)
+        if entities.empty:
+            continue
+        entity_type = str(entities.get("entity_type", pd.Series(["unknown"])).iloc[0])
+        layer_name = str(entities.get("layer_name", pd.Series(["Default"])).iloc[0])
+        marker_color = str(entities.get("marker_color", pd.Series([default_color])).iloc[0])
+        add_markers_to_map(m, entities, entity_type, marker_color, layer_name, shapes)
+
+    if scan_path is not None:
+        add_scan_grid_to_map(m, load_scan(scan_path), coverage_tag)
+
+    folium.LayerControl(collapsed=False).add_to(m)
+    write_atomic(path, m.get_root().render().encode("utf-8"))
+
+
+def scan_tags(entity_tags: list[str]) -> dict[str, Any]:
+    """Merge entity options into a single Overpass tag filter."""
+    tags: dict[str, Any] = {}
+    for ent in entity_tags:
+        key, value = parse_entity_tag(ent)
+        if value == "all" or tags.get(key) is True:
+            tags[key] = True
+        elif value not in tags.setdefault(key, []):
+            tags[key].append(value)
+    return tags
+
+
+def scan_grid(bbox: tuple[float, float, float, float], cell_size: int) -> tuple[int, int, float, float]:
+    """Return rows, columns and cell height/width in degrees for a grid over (south, west, north, east)."""
+    south, west, north, east = bbox
+    cell_lat = cell_size / METERS_PER_DEGREE
+    cell_lon = cell_size / (METERS_PER_DEGREE * math.cos(math.radians((south + north) / 2)))
+    rows = max(1, math.ceil((north - south) / cell_lat))
+    cols = max(1, math.ceil((east - west) / cell_lon))
+    return rows, cols, cell_lat, cell_lon
+
+
+def is_empty_response(error: Exception) -> bool:
+    """Tell whether osmnx raised because an Overpass query returned no features."""
+    return type(error).__name__ in {"EmptyOverpassResponse", "InsufficientResponseError"}
+
+
+def scan_tasks(
+    bbox: tuple[float, float, float, float], cell_size: int, entity_tags: list[str]
+) -> list[tuple[tuple[int, int, int, int], list[int]]]:
+    """Split a scan into (tile, tag indices) tasks, where a tile is (row_start, row_end, col_start, col_end).
+
+    Tags keyed by SCAN_AREA_KEYS mostly match huge relations (routes, parks,
+    protected areas) that would be downloaded again for every tile they touch,
+    so they are fetched once over the whole grid. All other tags are fetched
+    per tile of SCAN_TILE_CELLS x SCAN_TILE_CELLS cells.
+    """
+    rows, cols = scan_grid(bbox, cell_size)[:2]
+    area_indices = [i for i, ent in enumerate(entity_tags) if parse_entity_tag(ent)[0] in SCAN_AREA_KEYS]
+    tile_indices = [i for i in range(len(entity_tags)) if i not in area_indices]
+    tasks = [((0, rows, 0, cols), area_indices)] if area_indices else []
+    if tile_indices:
+        for row_start in range(0, rows, SCAN_TILE_CELLS):
+            for col_start in range(0, cols, SCAN_TILE_CELLS):
+                row_end = min(rows, row_start + SCAN_TILE_CELLS)
+                col_end = min(cols, col_start + SCAN_TILE_CELLS)
+                tasks.append(((row_start, row_end, col_start, col_end), tile_indices))
+    return tasks
+
+
+def tile_box(bbox: tuple[float, float, float, float], cell_size: int, tile: tuple[int, int, int, int]) -> Any:
+    """Return the polygon covering a tile's grid cells."""
+    south, west = bbox[:2]
+    _, _, cell_lat, cell_lon = scan_grid(bbox, cell_size)
+    row_start, row_end, col_start, col_end = tile
+    return box(
+        west + col_start * cell_lon,
+        south + row_start * cell_lat,
+        west + col_end * cell_lon,
+        south + row_end * cell_lat,
+    )
+
+
+def fetch_tile(
+    bbox: tuple[float, float, float, float],
+    cell_size: int,
+    entity_tags: list[str],
+    tile: tuple[int, int, int, int],
+    tag_indices: list[int],
+) -> pd.DataFrame | None:
+    """Fetch the features of one scan task from Overpass, or None when there are none.
+
+    Like fetch_features this is network-bound and runs in the session thread.
+    Only the tag columns needed for counting are kept, to keep the frame small
+    when it is handed to a worker process.
+    """
+    tile_tags = [entity_tags[i] for i in tag_indices]
+    try:
+        features = ox.features_from_polygon(tile_box(bbox, cell_size, tile), tags=scan_tags(tile_tags))
+    except Exception as e:
+        if is_empty_response(e):
+            return None
+        raise
+    keys = sorted({parse_entity_tag(ent)[0] for ent in tile_tags} & set(features.columns))
+    return features[[*keys, "geometry"]]
+
+
+def count_tile(
+    bbox: tuple[float, float, float, float],
+    cell_size: int,
+    entity_tags: list[str],
+    tile: tuple[int, int, int, int],
+    tag_indices: list[int],
+    features: pd.DataFrame | None,
+) -> np.ndarray:
+    """Count features per grid cell of one tile for the given tags.
+
+    Returns a (tags, tile rows, tile cols) matrix. Points and features no
+    larger than a cell count in the cell holding their representative point.
+    Larger areas and lines are clipped to the tile and count in every cell
+    they overlap. Features crossing tile edges come back from several tiles,
+    but either rule only counts the cells inside the current tile.
+    """
+    south, west = bbox[:2]
+    _, _, cell_lat, cell_lon = scan_grid(bbox, cell_size)
+    row_start, row_end, col_start, col_end = tile
+    tile_rows, tile_cols = row_end - row_start, col_end - col_start
+    counts = np.zeros((len(tag_indices), tile_rows, tile_cols), dtype=np.int32)
+    if features is None or features.empty:
+        return counts
+
+    geometries = np.asarray(features.geometry.values, dtype=object)
+    bounds = shapely.bounds(geometries)
+    small = (bounds[:, 2] - bounds[:, 0] <= cell_lon) & (bounds[:, 3] - bounds[:, 1] <= cell_lat)
+
+    small_index = np.flatnonzero(small)
+    points = shapely.point_on_surface(geometries[small_index])
+    point_rows = np.floor((shapely.get_y(points) - south) / cell_lat).astype(int) - row_start
+    point_cols = np.floor((shapely.get_x(points) - west) / cell_lon).astype(int) - col_start
+    owned = (point_rows >= 0) & (point_rows < tile_rows) & (point_cols >= 0) & (point_cols < tile_cols)
+
+    large_index = np.flatnonzero(~small)
+    clipped = shapely.intersection(geometries[large_index], tile_box(bbox, cell_size, tile))
+    cell_rows, cell_cols = np.divmod(np.arange(tile_rows * tile_cols), tile_cols)
+    cells = shapely.box(
+        west + (col_start + cell_cols) * cell_lon,
+        south + (row_start + cell_rows) * cell_lat,
+        west + (col_start + cell_cols + 1) * cell_lon,
+        south + (row_start + cell_rows + 1) * cell_lat,
+    )
+    hit_features, hit_cells = shapely.STRtree(cells).query(clipped, predicate="intersects")
+    # Shared edges alone do not count, or a feature ending on a cell border would count in both cells
+    overlapping = ~shapely.touches(clipped[hit_features], cells[hit_cells])
+    hit_features, hit_cells = hit_features[overlapping], hit_cells[overlapping]
+
+    feature_index = np.concatenate([small_index[owned], large_index[hit_features]])
+    rows = np.concatenate([point_rows[owned], cell_rows[hit_cells]])
+    cols = np.concatenate([point_cols[owned], cell_cols[hit_cells]])
+
+    for index, ent in enumerate(entity_tags[i] for i in tag_indices):
+        key, value = parse_entity_tag(ent)
+        if key not in features.columns:
+            continue
+        column = features[key]
+        matched = (column.notna() if value == "all" else column == value).to_numpy(dtype=bool)[feature_index]
+        np.add.at(counts[index], (rows[matched], cols[matched]), 1)
+    return counts
+
+
+def scan_tile(
+    path: Path,
+    bbox: tuple[float, float, float, float],
+    cell_size: int,
+    entity_tags: list[str],
+    tile: tuple[int, int, int, int],
+    tag_indices: list[int],
+    features: pd.DataFrame | None,
+) -> None:
+    """Count one scan task's fetched features and cache the counts."""
+    buffer = io.BytesIO()
+    np.save(buffer, count_tile(bbox, cell_size, entity_tags, tile, tag_indices, features))
+    write_atomic(path, buffer.getvalue())
+
+
+def assemble_scan(
+    path: Path,
+    bbox: tuple[float, float, float, float],
+    cell_size: int,
+    entity_tags: list[str],
+    task_paths: list[tuple[tuple[int, int, int, int], list[int], Path]],
+) -> None:
+    """Combine cached task counts into the full tags x rows x cols matrix and cache the scan."""
+    rows, cols, cell_lat, cell_lon = scan_grid(bbox, cell_size)
+    counts = np.zeros((len(entity_tags), rows, cols), dtype=np.int32)
+    for (row_start, row_end, col_start, col_end), tag_indices, task_path in task_paths:
+        counts[tag_indices, row_start:row_end, col_start:col_end] = np.load(task_path)
+
+    buffer = io.BytesIO()
+    np.savez_compressed(
+        buffer,
+        counts=counts,
+        tags=np.array(entity_tags),
+        bbox=np.array(bbox, dtype=float),
+        cell=np.array([cell_lat, cell_lon]),
+    )
+    write_atomic(path, buffer.getvalue())
+
+
+def load_scan(path: Path) -> dict[str, Any]:
+    """Load a cached area scan."""
+    with np.load(path) as data:
+        return {name: data[name] for name in data.files}
+
+
+def scan_table(scan: dict[str, Any]) -> pd.DataFrame:
+    """Flatten scan counts into one row per grid cell with a count column per tag."""
+    counts = scan["counts"]
+    south, west = scan["bbox"][:2]
+    cell_lat, cell_lon = scan["cell"]
+    tag_count, rows, cols = counts.shape
+    cell_rows, cell_cols = np.divmod(np.arange(rows * cols), cols)
+    cells = pd.DataFrame(
+        {
+            "row": cell_rows,
+            "col": cell_cols,
+            "latitude": south + (cell_rows + 0.5) * cell_lat,
+            "longitude": west + (cell_cols + 0.5) * cell_lon,
+        }
+    )
+    tag_counts = pd.DataFrame(counts.reshape(tag_count, -1).T, columns=[str(tag) for tag in scan["tags"]])
+    return pd.concat([cells, tag_counts], axis=1)
+
+
+def add_scan_grid_to_map(m: folium.Map, scan: dict[str, Any], coverage_tag: str | None = None) -> None:
+    """Add the scan grid as cells colored by count for one tag, or all tags when coverage_tag is None."""
+    counts = scan["counts"]
+    tags = [str(tag) for tag in scan["tags"]]
+    values = counts[tags.index(coverage_tag)] if coverage_tag in tags else counts.sum(axis=0)
+    south, west, north, east = scan["bbox"]
+    cell_lat, cell_lon = scan["cell"]
+
+    cell_rows, cell_cols = np.nonzero(values)
+    if len(cell_rows) > 0:
+        colormap = LinearColormap(
+            ["#ffffcc", SCAN_COLORS[0], SCAN_COLORS[1]],
+            vmin=1,
+            vmax=max(2, int(values.max())),
+            caption=f"SMART coverage: {coverage_tag or 'all tags'} (count per cell)",
+        )
+        cells = {
+            "type": "FeatureCollection",
+            "features": [
+                {
+                    "type": "Feature",
+                    "geometry": box(
+                        west + col * cell_lon,
+                        south + row * cell_lat,
+                        west + (col + 1) * cell_lon,
+                        south + (row + 1) * cell_lat,
+                    ).__geo_interface__,
+                    "properties": {"count": int(values[row, col])},
+                }
+                for row, col in zip(cell_rows, cell_cols)
+            ],
+        }
+        folium.GeoJson(
+            cells,
+            name=f"SMART coverage: {coverage_tag or 'all tags'}",
+            style_function=lambda feature: {
+                "fillColor": colormap(feature["properties"]["count"]),
+                "fillOpacity": 0.6,
+                "weight": 0,
+            },
+            tooltip=folium.GeoJsonTooltip(fields=["count"], aliases=["Count"]),
+        ).add_to(m)
+        colormap.add_to(m)
+
+    m.fit_bounds([[south, west], [north, east]])
+
+
+def render_pdf(path: Path, text: str) -> None:
+    """Render the provided text as a PDF and cache it."""
+    pdf = FPDF()
+    pdf.add_page()
+    pdf.set_auto_page_break(auto=True, margin=15)
+    pdf.set_left_margin(15)
+    pdf.set_right_margin(15)
+    pdf.set_font("Arial", size=12)
+
+    line_height = pdf.font_size * 2.5
+
+    for line in text.split("\n"):
+        words = line.split(" ")
+        current_line = ""
+        for word in words:
+            if pdf.get_string_width(current_line + word) < (pdf.w - pdf.l_margin - pdf.r_margin):
+                current_line += f"{word} "
+            else:
+                pdf.cell(0, line_height, txt=current_line.strip(), new_x="LMARGIN", new_y="NEXT")
+                current_line = f"{word} "
+        pdf.cell(0, line_height, txt=current_line.strip(), new_x="LMARGIN", new_y="NEXT")
+
+    raw_output: Any = pdf.output(dest="S")
+    if isinstance(raw_output, str):
+        raw_output = raw_output.encode("latin-1")
+
+    write_atomic(path, bytes(raw_output))